@@ -1,36 +1,246 @@
-import io
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import cast
+from urllib.parse import parse_qs, urlsplit
 
-import requests
-import pandas as pd
+import lxml.html
 import polars as pl
+import requests
 from loguru import logger
-from ordered_set import OrderedSet
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 URL_TEMPLATE = "https://outgassing.nasa.gov/outgassing-data-table?field_material_value_op=contains&field_material_value=&field_application_value_op=contains&field_application_value=&field_data_ref_value_op=contains&field_data_ref_value=&field_cvcm_value_op=%3C%3D&field_cvcm_value%5Bvalue%5D=&field_cvcm_value%5Bmin%5D=&field_cvcm_value%5Bmax%5D=&field_tml_value_op=%3C%3D&field_tml_value%5Bvalue%5D=&field_tml_value%5Bmin%5D=&field_tml_value%5Bmax%5D=&sort_by=field_material_value&sort_order=ASC&items_per_page=500&page={page_num}"
 
+# Number of pages fetched concurrently per batch.
+SCRAPE_WORKERS = 8
+
+# Whitespace and missing-value tokens in table cells, handled the same as `pandas.read_html`.
+WHITESPACE_PATTERN = re.compile(r"[\r\n]+|\s{2,}")
+NA_VALUES = frozenset(
+    [
+        "",
+        "#N/A",
+        "#N/A N/A",
+        "#NA",
+        "-1.#IND",
+        "-1.#QNAN",
+        "-NaN",
+        "-nan",
+        "1.#IND",
+        "1.#QNAN",
+        "<NA>",
+        "N/A",
+        "NA",
+        "NULL",
+        "NaN",
+        "None",
+        "n/a",
+        "nan",
+        "null",
+    ]
+)
+
+# Shared session, so that all page fetches reuse the same keep-alive connection.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=SCRAPE_WORKERS,
+        max_retries=Retry(total=3, backoff_factor=0.5),
+    ),
+)
+# Accept-Encoding is left at the requests default, which already includes "br" when
+# `brotli` is installed.
+SESSION.headers.update(
+    {
+        "User-Agent": "nasa-outgassing-database-scraper (+https://github.com/DeflateAwning/NASA-Outgassing-Database)",
+    }
+)
+
+
+SPACEX_CLASSIFICATIONS = pl.Enum(
+    [
+        "Pass",
+        "Rationale Code A (up to 2 sq-in)",
+        "Rationale Code B (up to 0.25 sq-in)",
+        "Fail",
+    ]
+)
+
+# Acronyms in the "Application" column, which should stay upper-case after title-casing.
+ACRONYMS = (
+    "RF",
+    "RFI",
+    "EMC",
+    "EMI",
+    "ESD",
+    "UV",
+    "DVD",
+    "IC",
+    "ID",
+    "PC",
+    "PCB",
+    "LED",
+    "LCD",
+    "TC",
+    "LRO",
+)
+ACRONYM_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(ACRONYMS, key=len, reverse=True)) + r")\b",
+    flags=re.IGNORECASE,
+)
+
+# Word-level clean-ups for the "Application" column, as (pattern, replacement) pairs.
+# Applied in a single pass, so compound rules must come before the words they contain.
+# Patterns must not contain capturing groups.
+APPLICATION_WORD_RULES: list[tuple[str, str]] = [
+    (r"(?:elec\b|electrical).(?:\bcond|conductive)", "Electrically-Conductive"),
+    (r"(?:ther\b|therm\w*).(?:\bcond|conductive)", "Thermally-Conductive"),
+    (r"adh", "Adhesive"),
+    (r"tpe", "Tape"),
+    (r"anti.?static", "Antistatic"),
+    (r"conf", "Conformal"),
+    (r"cond", "Conductive"),
+    (r"cpnd|cmpd", "Compound"),
+    (r"elec", "Electrical"),
+    (r"blk", "Black"),
+    (r"unk", "Unknown"),
+    (r"vib", "Vibration"),
+    (r"opt", "Optical"),  # Abbreviation unification.
+    (r"therm?", "Thermal"),  # Abbreviation unification.
+    (r"lube", "Lubricant"),  # Abbreviation unification.
+    (r"(?:matl|mtl)s?\.?", "Material"),  # Abbreviation fix.
+    (r"maerials", "Materials"),  # Typo fix.
+    (r"coatint", "Coating"),  # Typo fix.
+    (r"wrap+i[nm]g", "Wrapping"),  # Typo fix.
+    (r"and", "and"),  # Lowercase "and"
+    (r"for", "for"),  # Lowercase "for"
+]
+APPLICATION_WORD_PATTERN = re.compile(
+    r"\b(?:"
+    + "|".join(f"({pattern})" for pattern, _ in APPLICATION_WORD_RULES)
+    + r")\b",
+    flags=re.IGNORECASE,
+)
+
+# Regex clean-ups for the "Application" column, as (pattern, replacement) pairs.
+# Applied in order, after the word-level clean-ups.
+# Extra spaces are only removed at the end, so these allow runs of whitespace.
+APPLICATION_REGEX_RULES: list[tuple[str, str]] = [
+    (r"3(?:\s+|.)?[Dd]", "3D"),  # Normalize 3D/3D (e.g., "3D Printing")
+    (r"(?i)\b[0O](?:\s+|.)?ring\b", "O-Ring"),  # Normalize O-ring
+]
+
+# Whole-value replacements for the "Application" column, applied after all other clean-ups.
+# These only match the entire value (e.g., "PC Board" but not "PC Board Coating").
+APPLICATION_VALUE_REPLACEMENTS = {
+    "2 Side Tape": "Tape, Double-Sided",
+    "2 Sided Tape": "Tape, Double-Sided",
+    "Tape 2 Side": "Tape, Double-Sided",
+    "Tape 2 Sided": "Tape, Double-Sided",
+    "Capicator": "Capacitor",
+    "Electrical Comp": "Electrical Component",
+    "Electrical Components": "Electrical Component",
+    "PC Board": "PCB",
+}
+
+
+def uppercase_acronyms(application: str) -> str:
+    return ACRONYM_PATTERN.sub(lambda match: match.group(1).upper(), application)
+
+
+def expand_application_words(application: str) -> str:
+    return APPLICATION_WORD_PATTERN.sub(
+        lambda match: APPLICATION_WORD_RULES[match.lastindex - 1][1],  # pyright: ignore
+        application,
+    )
+
+
+def normalize_application(application: pl.Expr) -> pl.Expr:
+    """Build the expression that cleans up the "Application" column."""
+    application = (
+        application.str.to_titlecase()
+        .map_elements(uppercase_acronyms, return_dtype=pl.String)
+        .str.replace_all("&", " and ", literal=True)
+        # Abbreviations and typos. See APPLICATION_WORD_RULES.
+        .map_elements(expand_application_words, return_dtype=pl.String)
+    )
+    for pattern, replacement in APPLICATION_REGEX_RULES:
+        application = application.str.replace_all(pattern, replacement)
+    return (
+        application.str.replace_all(".", "", literal=True)  # Remove periods
+        .str.replace_all(r"\s+", " ")  # Remove extra spaces
+        .str.strip_chars()
+        .replace(APPLICATION_VALUE_REPLACEMENTS)
+    )
+
+
+# Built once, so the same expression (and its regex patterns) is reused on every scrape.
+NORMALIZED_APPLICATION = normalize_application(pl.col("Application"))
+
+
+def clean_cell_text(cell: lxml.html.HtmlElement) -> str:
+    """Get a table cell's text, with whitespace collapsed like `pandas.read_html` does."""
+    text = cast(str, cell.text_content())  # pyright: ignore
+    return WHITESPACE_PATTERN.sub(" ", text.strip())
+
 
-def do_scrape(page_num: int) -> pl.DataFrame | None:
+def find_elements(
+    element: lxml.html.HtmlElement, path: str
+) -> list[lxml.html.HtmlElement]:
+    """Get the elements under `element` that match an XPath expression."""
+    return cast(list[lxml.html.HtmlElement], element.xpath(path))  # pyright: ignore
+
+
+def get_last_page_num(tree: lxml.html.HtmlElement) -> int | None:
+    """Get the last page number from the page's pager, if it has one."""
+    hrefs = cast(
+        list[str],
+        tree.xpath('//li[contains(@class, "pager__item--last")]/a/@href'),  # pyright: ignore
+    )
+    if not hrefs:
+        return None
+    page_values = parse_qs(urlsplit(hrefs[0]).query).get("page")
+    if not page_values:
+        return None
+    return int(page_values[0])
+
+
+def do_scrape(
+    page_num: int, read_pager: bool = False
+) -> tuple[pl.DataFrame, int | None] | None:
+    """Scrape a page. Returns its data table and, if `read_pager` is set, the last page
+    number from the pager.
+    """
     url = URL_TEMPLATE.format(page_num=page_num)
-    response = requests.get(url)
+    response = SESSION.get(url, timeout=30)
     response.raise_for_status()
 
-    if "<table" not in response.text:
+    # Check the raw bytes, to avoid decoding the body just to look for the table.
+    body = response.content
+    if b"<table" not in body:
         return None
 
-    # Read the HTML table into a DataFrame
-    df_pd = pd.read_html(  # pyright: ignore
-        io.StringIO(response.text),
-        flavor="lxml",
-    )[0]
+    # Read the HTML table into a DataFrame. Pass the raw bytes so lxml detects the encoding.
+    tree = cast(lxml.html.HtmlElement, lxml.html.fromstring(body))  # pyright: ignore
+    table = cast(lxml.html.HtmlElement | None, tree.find(".//table"))  # pyright: ignore
+    if table is None:
+        return None
+    headers = [clean_cell_text(th) for th in find_elements(table, ".//thead//th")]
+    rows = [
+        [clean_cell_text(td) for td in find_elements(tr, "./td")]
+        for tr in find_elements(table, ".//tbody/tr")
+    ]
 
-    df = pl.from_pandas(df_pd)
+    df = pl.DataFrame(
+        rows, schema={header: pl.String for header in headers}, orient="row"
+    )
 
     df = (
-        df.with_columns(
-            pl.all().cast(pl.String),
-        )
-        .with_columns(pl.all().str.strip_chars().replace("", None))
+        df.with_columns(pl.all().str.strip_chars().replace(list(NA_VALUES), None))
         .rename(
             {
                 "TML %": "TML_Pct",
@@ -42,170 +252,154 @@ def do_scrape(page_num: int) -> pl.DataFrame | None:
         .rename(lambda col: col.strip().replace(" ", "_"))
         .cast(
             {
-                "TML_Pct": pl.Decimal,
-                "WVR_Pct": pl.Decimal,
-                "CVCM_Pct": pl.Decimal,
+                "TML_Pct": pl.Float64,
+                "WVR_Pct": pl.Float64,
+                "CVCM_Pct": pl.Float64,
             }
         )
         .with_columns(
-            # Remove decimal places from Year:
-            pl.col("Year").cast(pl.Float64).cast(pl.UInt16),
-            # Calculate SpaceX "Recoverable Mass Loss (RML)" from TML and WVR:
-            RML_Pct=pl.col("TML_Pct") - pl.col("WVR_Pct").fill_null(0.0),
+            # Take the 4-digit year, dropping any decimal places (e.g., "1997.0"):
+            pl.col("Year").str.extract(r"(\d{4})").cast(pl.UInt16),
+            # Calculate SpaceX "Recoverable Mass Loss (RML)" from TML and WVR (missing WVR is 0).
+            # Source values have 2 decimal places, so round off the float subtraction error:
+            RML_Pct=pl.when(pl.col("WVR_Pct").is_null())
+            .then(pl.col("TML_Pct"))
+            .otherwise((pl.col("TML_Pct") - pl.col("WVR_Pct")).round(2)),
         )
     )
-    return df
+    return df, get_last_page_num(tree) if read_pager else None
 
 
 def scrape_nasa_outgassing() -> pl.DataFrame:
     df_list: list[pl.DataFrame] = []
-    page_num = 1
 
-    while True:
-        df = do_scrape(page_num)
+    first_page = do_scrape(1, read_pager=True)
+    if first_page is None:
+        raise ValueError("No data table found on page 1.")
+    df, last_page_num = first_page
+    logger.info(
+        f"Scraped page 1: {len(df)} rows. Last page from pager: {last_page_num}"
+    )
+    df_list.append(df)
 
-        if df is None:
-            logger.info(f"No data table found on page {page_num}. End of scrape.")
-            break
+    next_batch = 2
+    with ThreadPoolExecutor(max_workers=SCRAPE_WORKERS) as executor:
+        while last_page_num is None or next_batch <= last_page_num:
+            # Fetch all remaining pages at once if the pager gave the last page.
+            # Otherwise, speculatively fetch a batch of pages.
+            batch_end = (
+                last_page_num + 1
+                if last_page_num is not None
+                else next_batch + SCRAPE_WORKERS
+            )
+            page_nums = range(next_batch, batch_end)
+            futures = [executor.submit(do_scrape, page_num) for page_num in page_nums]
 
-        logger.info(f"Scraped page {page_num}: {len(df)} rows")
+            # Consume the pages in page order.
+            reached_end = False
+            for page_num, future in zip(page_nums, futures):
+                page = future.result()
 
-        df_list.append(df)
-        page_num += 1
+                if page is None:
+                    logger.info(
+                        f"No data table found on page {page_num}. End of scrape."
+                    )
+                    reached_end = True
+                    break
 
-    df = pl.concat(df_list, how="vertical")
+                df, _ = page
+                logger.info(f"Scraped page {page_num}: {len(df)} rows")
+                df_list.append(df)
 
-    count_before = len(df)
-    df = df.unique(maintain_order=True)
-    count_after = len(df)
-    logger.info(
-        f"Removed {count_before - count_after} duplicate rows. Remaining rows: {count_after:,} rows."
-    )
+            if reached_end:
+                break
+            next_batch = batch_end
+
+    # Build the rest of the processing as one lazy query, so it is only materialized once.
+    lf = pl.concat(df_list, how="vertical", rechunk=True).lazy()
+    lf = lf.unique(maintain_order=True)
 
     # Add col: "SpaceX_Classification"
-    df = df.with_columns(
-        SpaceX_Classification=(
-            pl.when(
-                # Per RPUG V10 Rev 2024-09, Table 5-5.
-                (pl.col("RML_Pct") <= pl.lit(1.0)) & (pl.col("CVCM_Pct") <= pl.lit(0.1))
-            )
-            .then(pl.lit("Pass"))
-            .when(
-                # Per RPUG V10 Rev 2024-09, Table 6-7.
-                (pl.col("RML_Pct") <= pl.lit(3.0)) & (pl.col("CVCM_Pct") <= pl.lit(0.1))
-            )
-            .then(pl.lit("Rationale Code A (up to 2 sq-in)"))
-            .when(
-                # Per RPUG V10 Rev 2024-09, Table 6-7
-                (pl.col("RML_Pct") > pl.lit(3.0)) | (pl.col("CVCM_Pct") > pl.lit(0.1))
-            )
-            .then(pl.lit("Rationale Code B (up to 0.25 sq-in)"))
-            .otherwise(pl.lit("Fail"))
+    # Per RPUG V10 Rev 2024-09, Table 5-5 (Pass) and Table 6-7 (Rationale Codes A and B).
+    # Encode the thresholds as a bucket number (with nulls as their own code), then look it up.
+    cvcm_code = (
+        (pl.col("CVCM_Pct") > pl.lit(0.1, dtype=pl.Float64)).cast(pl.UInt8).fill_null(2)
+    )  # 0: <= 0.1, 1: > 0.1, 2: null
+    rml_code = (
+        (pl.col("RML_Pct") > pl.lit(1.0, dtype=pl.Float64)).cast(pl.UInt8)
+        + (pl.col("RML_Pct") > pl.lit(3.0, dtype=pl.Float64)).cast(pl.UInt8)
+    ).fill_null(3)  # 0: <= 1.0, 1: <= 3.0, 2: > 3.0, 3: null
+    lf = lf.with_columns(
+        SpaceX_Classification=(cvcm_code * 4 + rml_code).replace_strict(
+            {
+                0: "Pass",
+                1: "Rationale Code A (up to 2 sq-in)",
+                2: "Rationale Code B (up to 0.25 sq-in)",
+                4: "Rationale Code B (up to 0.25 sq-in)",
+                5: "Rationale Code B (up to 0.25 sq-in)",
+                6: "Rationale Code B (up to 0.25 sq-in)",
+                7: "Rationale Code B (up to 0.25 sq-in)",
+                10: "Rationale Code B (up to 0.25 sq-in)",
+            },
+            default="Fail",  # Missing data.
+            return_dtype=SPACEX_CLASSIFICATIONS,
         )
     )
 
-    acronyms = (
-        "RF",
-        "RFI",
-        "EMC",
-        "EMI",
-        "ESD",
-        "UV",
-        "DVD",
-        "IC",
-        "ID",
-        "PC",
-        "PCB",
-        "LED",
-        "LCD",
-        "TC",
-        "LRO",
-        "PCB",
-    )
-
     # Clean up the "Application" column.
-    unique_applications_before = df["Application"].n_unique()
-    df = df.with_columns(
-        pl.col("Application").str.to_titlecase(),
-        Raw_Application=pl.col("Application"),  # Unmodified from source.
+    # Many rows share the same value, so only the distinct values are normalized, then joined back.
+    applications = lf.select(pl.col("Application").unique()).with_columns(
+        Normalized_Application=NORMALIZED_APPLICATION
     )
-    for acronym in acronyms:
-        df = df.with_columns(
-            pl.col("Application").str.replace_all(rf"(?i)\b{acronym}\b", acronym)
+    lf = (
+        lf.join(
+            applications,
+            on="Application",
+            how="left",
+            nulls_equal=True,
+            maintain_order="left",
         )
-    df = df.with_columns(
-        pl.col("Application")
-        .str.replace_all("&", " and ", literal=True)
-        .str.replace_all(r"(?i)\b(Adh)\b", "Adhesive")
-        .str.replace_all(r"(?i)\b(Tpe)\b", "Tape")
-        .str.replace_all(r"(?i)\b(Anti.?static)\b", "Antistatic")
-        .str.replace_all(r"(?i)\b(Conf)\b", "Conformal")
-        .str.replace_all(r"(?i)\b(Cond)\b", "Conductive")
-        .str.replace_all(r"(?i)\b(Cpnd)\b", "Compound")
-        .str.replace_all(r"(?i)\b(Cmpd)\b", "Compound")
-        .str.replace_all(r"(?i)\b(Elec)\b", "Electrical")
-        .str.replace_all(r"(?i)\b(electrical.conductive)\b", "Electrically-Conductive")
-        .str.replace_all(r"(?i)\b(blk)\b", "Black")
-        .str.replace_all(r"(?i)\b(unk)\b", "Unknown")
-        .str.replace_all(r"(?i)\b(vib)\b", "Vibration")
-        .str.replace_all(r"(?i)\b(opt)\b", "Optical")  # Abbreviation unification.
-        .str.replace_all(r"(?i)\b(therm?)\b", "Thermal")  # Abbreviation unification.
-        .str.replace_all(
-            r"(?i)\b(therm\w*.conductive)\b", "Thermally-Conductive"
-        )  # Abbreviation unification.
-        .str.replace_all(r"(?i)\b(lube)\b", "Lubricant")  # Abbreviation unification.
-        .str.replace_all(r"(?i)\b(matl|mtl)s?\.?\b", "Material")  # Abbreviation fix.
-        .str.replace_all(r"(?i)\bmaerials\b", "Materials")  # Typo fix.
-        .str.replace_all(r"(?i)\bcoatint\b", "Coating")  # Typo fix.
-        .str.replace_all(r"(?i)\bWrap+i[nm]g\b", "Wrapping")  # Typo fix.
-        .str.replace_all(r"\s+", " ")  # Remove extra spaces
-        .str.replace_all(r"3.?[Dd]", "3D")  # Normalize 3D/3D (e.g., "3D Printing")
-        .str.replace_all(r"(?i)\b[0O].?ring\b", "O-Ring")  # Normalize O-ring
-        .str.replace_all(r"(?i)\band\b", "and")  # Lowercase "and"
-        .str.replace_all(r"(?i)\bfor\b", "for")  # Lowercase "for"
-        .str.replace_all(".", "", literal=True)  # Remove periods
-        .str.replace_all(r"\s+", " ")  # Remove extra spaces
-        .str.strip_chars()
-        .replace(
-            {
-                "2 Side Tape": "Tape, Double-Sided",
-                "2 Sided Tape": "Tape, Double-Sided",
-                "Tape 2 Side": "Tape, Double-Sided",
-                "Tape 2 Sided": "Tape, Double-Sided",
-                "Capicator": "Capacitor",
-                "Electrical Comp": "Electrical Component",
-                "Electrical Components": "Electrical Component",
-                "PC Board": "PCB",
-            }
+        # Keep the unmodified source value as "Raw_Application".
+        .rename(
+            {"Application": "Raw_Application", "Normalized_Application": "Application"}
         )
     )
-    unique_applications_after = df["Application"].n_unique()
-    logger.info(
-        f"Normalized 'Application' column: {unique_applications_before} unique values before, "
-        f"{unique_applications_after} unique values after."
-    )
 
     # Re-order the columns.
-    main_cols = OrderedSet(
-        [
-            "Material",
-            "Application",
-            "TML_Pct",
-            "WVR_Pct",
-            "CVCM_Pct",
-            "RML_Pct",
-            "Year",
-            "SpaceX_Classification",
-            "Data_Ref",
-            "Manufacturer",
-        ]
-    )
-    other_cols = OrderedSet(df.columns) - main_cols
-    all_cols = list(main_cols | other_cols)
-    df = df.select(all_cols)
+    main_cols = [
+        "Material",
+        "Application",
+        "TML_Pct",
+        "WVR_Pct",
+        "CVCM_Pct",
+        "RML_Pct",
+        "Year",
+        "SpaceX_Classification",
+        "Data_Ref",
+        "Manufacturer",
+    ]
+    last_cols = ["Raw_Application"]
+    main_cols_set = set(main_cols)
+    other_cols = [
+        col
+        for col in lf.collect_schema().names()
+        if col not in main_cols_set and col not in last_cols
+    ]
+    lf = lf.select(main_cols + other_cols + last_cols)
+
+    df = lf.collect(engine="streaming")
 
     # Note: Seems that no individual column is a proper unique key. Not "Material" nor "Data_Ref".
 
+    count_before = sum(len(page_df) for page_df in df_list)
+    count_after = len(df)
+    logger.info(
+        f"Removed {count_before - count_after} duplicate rows. Remaining rows: {count_after:,} rows."
+    )
+    logger.info(
+        f"Normalized 'Application' column: {df['Raw_Application'].n_unique()} unique values before, "
+        f"{df['Application'].n_unique()} unique values after."
+    )
     logger.info(
         f"Summary by 'SpaceX_Classification': {df['SpaceX_Classification'].value_counts(sort=True)}"
     )
@@ -217,9 +411,20 @@ def main() -> None:
     df = scrape_nasa_outgassing()
 
     output_folder = Path(__file__).parent / "output"
-    df.write_csv(output_folder / "nasa_outgassing.csv")
-    df.write_parquet(output_folder / "nasa_outgassing.pq")
-    df.write_excel(output_folder / "nasa_outgassing.xlsx")
+    # Write the output files concurrently.
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(df.write_csv, output_folder / "nasa_outgassing.csv"),
+            executor.submit(
+                df.write_parquet,
+                output_folder / "nasa_outgassing.pq",
+                compression="zstd",
+                compression_level=3,
+            ),
+            executor.submit(df.write_excel, output_folder / "nasa_outgassing.xlsx"),
+        ]
+        for future in futures:
+            future.result()  # Re-raise any errors from the writers.
     logger.info("Scraping completed and data saved to nasa_outgassing.csv")
 
 